@@ -1,41 +1,178 @@
-import json
 import hashlib
+import logging
 from typing import Any, Iterable
 import libsql
+import orjson
 
 from .settings import settings
 
+logger = logging.getLogger("mimecast")
+
+_blake2b = hashlib.blake2b
+
+
+# journal_mode=WAL is persisted in the database file, so it only needs setting
+# once per path. The remaining PRAGMAs are per-connection and cheap to re-apply.
+_pragmas_applied: set[str] = set()
+
+_CONNECTION_PRAGMAS = """
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-16000;
+PRAGMA mmap_size=268435456;
+PRAGMA busy_timeout=10000;
+"""
+
+
+def _apply_pragmas(conn) -> None:
+    if settings.db_path not in _pragmas_applied:
+        # WAL lets the poller write while UI requests keep reading
+        conn.execute("PRAGMA journal_mode=WAL;")
+        _pragmas_applied.add(settings.db_path)
+    conn.executescript(_CONNECTION_PRAGMAS)
+
 
 def connect_db():
     # libsql.connect can be local-only or an embedded replica that syncs from remote
     # (sync_url/auth_token optional). :contentReference[oaicite:4]{index=4}
     if settings.libsql_url and settings.libsql_auth_token:
-        return libsql.connect(
+        conn = libsql.connect(
             settings.db_path,
             sync_url=settings.libsql_url,
             auth_token=settings.libsql_auth_token,
         )
-    return libsql.connect(settings.db_path)
+    else:
+        conn = libsql.connect(settings.db_path)
+    _apply_pragmas(conn)
+    return conn
+
+
+_SEARCH_LOGS_DDL = """
+CREATE TABLE IF NOT EXISTS search_logs (
+  id BLOB PRIMARY KEY,
+  create_time TEXT NOT NULL,
+  email_addr TEXT NOT NULL,
+  search_text TEXT,
+  muse_query TEXT,
+  description TEXT,
+  search_reason TEXT,
+  source TEXT,
+  is_admin INTEGER,
+  search_path TEXT,
+  raw_json TEXT,
+  day TEXT GENERATED ALWAYS AS (substr(create_time, 1, 10)) VIRTUAL
+);
+"""
+
+_LOG_COLUMNS = (
+    "create_time, email_addr, search_text, muse_query, description, "
+    "search_reason, source, is_admin, search_path, raw_json"
+)
+
+# Hot statements kept as module constants so every call sends identical SQL
+# text (libsql has no explicit prepare() to hold on to a statement handle).
+# INSERT OR IGNORE keeps it idempotent (and cheap on conflict, unlike REPLACE).
+_INSERT_LOG_SQL = (
+    f"INSERT OR IGNORE INTO search_logs (id, {_LOG_COLUMNS}) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_KV_GET_SQL = "SELECT v FROM kv WHERE k = ?"
+_KV_SET_SQL = "INSERT INTO kv (k, v) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET v=excluded.v"
+
+
+def _migrate_text_ids(conn) -> None:
+    # Older databases keyed rows on a 64-char SHA-256 hex string. Rebuild the
+    # table with 16-byte BLAKE2b ids, recomputed from the stored raw_json so
+    # dedupe keeps working against rows already on disk.
+    logger.info("Migrating search_logs ids from SHA-256 hex to BLAKE2b-128 BLOB")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("ALTER TABLE search_logs RENAME TO search_logs_old")
+        conn.execute(_SEARCH_LOGS_DDL)
+
+        cur = conn.execute(f"SELECT {_LOG_COLUMNS} FROM search_logs_old")
+        while True:
+            batch = cur.fetchmany(1000)
+            if not batch:
+                break
+            conn.executemany(
+                _INSERT_LOG_SQL,
+                [(stable_log_id(orjson.loads(r[9])), *r) for r in batch],
+            )
+
+        # Dropping the old table also drops its indexes; init_schema recreates them
+        conn.execute("DROP TABLE search_logs_old")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _init_rollup(conn) -> None:
+    # Per-user, per-day search counts kept current by a trigger, so the summary
+    # page sums (users x days) rows instead of scanning every log in the window.
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_logs_by_day'"
+    ).fetchone()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_logs_by_day (
+          email_addr TEXT NOT NULL,
+          day TEXT NOT NULL,
+          cnt INTEGER NOT NULL,
+          PRIMARY KEY (email_addr, day)
+        );
+        """)
+        if not exists:
+            # First run on an existing database: seed from what is already stored
+            conn.execute("""
+            INSERT INTO search_logs_by_day (email_addr, day, cnt)
+            SELECT email_addr, day, COUNT(*) FROM search_logs GROUP BY email_addr, day;
+            """)
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_search_logs_rollup AFTER INSERT ON search_logs
+        BEGIN
+          INSERT INTO search_logs_by_day (email_addr, day, cnt)
+          VALUES (new.email_addr, substr(new.create_time, 1, 10), 1)
+          ON CONFLICT(email_addr, day) DO UPDATE SET cnt = cnt + 1;
+        END;
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
 
 
 def init_schema(conn) -> None:
-    conn.execute("""
-    CREATE TABLE IF NOT EXISTS search_logs (
-      id TEXT PRIMARY KEY,
-      create_time TEXT NOT NULL,
-      email_addr TEXT NOT NULL,
-      search_text TEXT,
-      muse_query TEXT,
-      description TEXT,
-      search_reason TEXT,
-      source TEXT,
-      is_admin INTEGER,
-      search_path TEXT,
-      raw_json TEXT
-    );
-    """)
+    conn.execute(_SEARCH_LOGS_DDL)
+
+    id_type = next(
+        (r[2] for r in conn.execute("PRAGMA table_info(search_logs)").fetchall() if r[1] == "id"),
+        None,
+    )
+    if id_type and id_type.upper() == "TEXT":
+        _migrate_text_ids(conn)
+
+    # Calendar day (YYYY-MM-DD) as an indexable column rather than substr() per
+    # row at query time. SQLite can only ALTER in VIRTUAL generated columns;
+    # the index below stores the values anyway.
+    columns = {r[1] for r in conn.execute("PRAGMA table_xinfo(search_logs)").fetchall()}
+    if "day" not in columns:
+        conn.execute(
+            "ALTER TABLE search_logs ADD COLUMN "
+            "day TEXT GENERATED ALWAYS AS (substr(create_time, 1, 10)) VIRTUAL"
+        )
+
     conn.execute("CREATE INDEX IF NOT EXISTS idx_search_logs_email_time ON search_logs(email_addr, create_time);")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_logs_time ON search_logs(create_time);")
+    # Range scans on create_time that group or order by email_addr. It leads
+    # with create_time, making the old single-column index redundant.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_logs_time_email ON search_logs(create_time, email_addr);")
+    conn.execute("DROP INDEX IF EXISTS idx_search_logs_time;")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_logs_day ON search_logs(day);")
+
+    _init_rollup(conn)
 
     conn.execute("""
     CREATE TABLE IF NOT EXISTS kv (
@@ -46,59 +183,77 @@ def init_schema(conn) -> None:
     conn.commit()
 
 
-def stable_log_id(log: dict[str, Any]) -> str:
-    # Create a stable ID to dedupe across polling windows/pages
-    parts = [
-        str(log.get("emailAddr", "")).lower(),
-        str(log.get("createTime", "")),
-        str(log.get("searchText", "")),
-        str(log.get("museQuery", "")),
-        str(log.get("searchPath", "")),
-    ]
-    h = hashlib.sha256(("|".join(parts)).encode("utf-8")).hexdigest()
-    return h
+def stable_log_id(log: dict[str, Any]) -> bytes:
+    # Create a stable ID to dedupe across polling windows/pages.
+    # BLAKE2b-128 is much cheaper than SHA-256 and the raw 16-byte digest keeps
+    # the primary key index a quarter of the size of the old hex text.
+    get = log.get
+    key = (
+        f"{str(get('emailAddr', '')).lower()}|{get('createTime', '')}|"
+        f"{get('searchText', '')}|{get('museQuery', '')}|{get('searchPath', '')}"
+    )
+    return _blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def _log_row(log: dict[str, Any]) -> tuple:
+    # Flatten one API log into the search_logs column order
+    get = log.get
+    return (
+        stable_log_id(log),
+        get("createTime"),
+        (get("emailAddr") or "").lower(),
+        get("searchText"),
+        get("museQuery"),
+        get("description"),
+        get("searchReason"),
+        get("source"),
+        1 if get("isAdmin") else 0,
+        get("searchPath"),
+        # orjson emits compact UTF-8 JSON, like json.dumps(separators=(",", ":"))
+        orjson.dumps(log).decode(),
+    )
 
 
 def upsert_logs(conn, logs: Iterable[dict[str, Any]]) -> int:
-    inserted = 0
-    for log in logs:
-        _id = stable_log_id(log)
-        raw = json.dumps(log, separators=(",", ":"), ensure_ascii=False)
-
-        # INSERT OR IGNORE to keep it idempotent
-        cur = conn.execute(
-            """
-            INSERT OR IGNORE INTO search_logs
-            (id, create_time, email_addr, search_text, muse_query, description, search_reason, source, is_admin, search_path, raw_json)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            [
-                _id,
-                log.get("createTime"),
-                (log.get("emailAddr") or "").lower(),
-                log.get("searchText"),
-                log.get("museQuery"),
-                log.get("description"),
-                log.get("searchReason"),
-                log.get("source"),
-                1 if log.get("isAdmin") else 0,
-                log.get("searchPath"),
-                raw,
-            ],
-        )
-        # libsql/sqlite cursor rowcount behaviour can vary; treat as best-effort
-        if getattr(cur, "rowcount", 0) == 1:
-            inserted += 1
+    rows = list(map(_log_row, logs))
+    if not rows:
+        return 0
 
-    conn.commit()
-    return inserted
+    # One explicit write transaction per batch: a single commit/fsync instead of
+    # per-row autocommit overhead. total_changes() would also count the rollup
+    # trigger's writes, so count inserts by diffing the batch ids against the
+    # ids already stored instead.
+    ids = list({r[0] for r in rows})
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        existing = 0
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            existing += conn.execute(
+                f"SELECT COUNT(*) FROM search_logs WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ).fetchone()[0]
+
+        conn.executemany(_INSERT_LOG_SQL, rows)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return len(ids) - existing
 
 
 def kv_get(conn, k: str) -> str | None:
-    row = conn.execute("SELECT v FROM kv WHERE k = ?", [k]).fetchone()
+    row = conn.execute(_KV_GET_SQL, [k]).fetchone()
     return row[0] if row else None
 
 
-def kv_set(conn, k: str, v: str) -> None:
-    conn.execute("INSERT INTO kv (k, v) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET v=excluded.v", [k, v])
-    conn.commit()
+def kv_set_many(conn, items: dict[str, str]) -> None:
+    # Several keys in one transaction: a single commit instead of one per key
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(_KV_SET_SQL, list(items.items()))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
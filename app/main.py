@@ -1,15 +1,17 @@
 import asyncio
 import datetime as dt
+from contextlib import aclosing
 import logging
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 
 from .settings import settings
-from .db import connect_db, init_schema, kv_get, kv_set, upsert_logs
-from .mimecast_client import fetch_search_logs
+from .db import connect_db, init_schema, kv_get, kv_set_many, upsert_logs
+from .mimecast_client import aclose_client, fetch_search_logs, format_iso
 
 
 # -------------------------------------------------------------------
@@ -36,7 +38,28 @@ def utcnow() -> dt.datetime:
 
 
 def parse_iso(ts: str) -> dt.datetime:
-    return dt.datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    # Python 3.11+ fromisoformat accepts the trailing "Z" directly
+    return dt.datetime.fromisoformat(ts)
+
+
+# -------------------------------------------------------------------
+# DB connections (opened once at startup)
+# -------------------------------------------------------------------
+
+async def get_read_conn(request: Request):
+    # Borrow a read-only connection from the pool for the life of the request
+    pool: asyncio.Queue = request.app.state.read_pool
+    conn = await pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put_nowait(conn)
+
+
+async def get_write_conn(request: Request):
+    # Single shared read-write connection; the lock serialises writers
+    async with request.app.state.write_lock:
+        yield request.app.state.rw_conn
 
 
 # -------------------------------------------------------------------
@@ -44,12 +67,12 @@ def parse_iso(ts: str) -> dt.datetime:
 # -------------------------------------------------------------------
 
 async def poll_once():
-    conn = connect_db()
-    init_schema(conn)
-
+    conn = app.state.rw_conn
     now = utcnow()
-    last = kv_get(conn, LAST_POLLED_KEY)
-    bootstrapped = kv_get(conn, BOOTSTRAP_DONE_KEY)
+
+    async with app.state.write_lock:
+        last = await run_in_threadpool(kv_get, conn, LAST_POLLED_KEY)
+        bootstrapped = await run_in_threadpool(kv_get, conn, BOOTSTRAP_DONE_KEY)
 
     if not bootstrapped:
         start = now - dt.timedelta(days=settings.initial_backfill_days)
@@ -68,16 +91,30 @@ async def poll_once():
 
     end = now
 
-    logs = await fetch_search_logs(start=start, end=end)
-    inserted = upsert_logs(conn, logs)
-
-    kv_set(conn, LAST_POLLED_KEY, end.isoformat().replace("+00:00", "Z"))
-    kv_set(conn, BOOTSTRAP_DONE_KEY, "1")
+    fetched = 0
+    inserted = 0
+
+    # Insert page by page as it arrives (each page is its own transaction).
+    # libsql calls are blocking; keep them off the event loop so UI requests
+    # are still served while a large batch (e.g. the backfill) is inserted.
+    # aclosing() cancels the prefetched page request right away if an insert fails
+    async with aclosing(fetch_search_logs(start=start, end=end)) as pages:
+        async for batch in pages:
+            fetched += len(batch)
+            async with app.state.write_lock:
+                inserted += await run_in_threadpool(upsert_logs, conn, batch)
+
+    async with app.state.write_lock:
+        await run_in_threadpool(
+            kv_set_many,
+            conn,
+            {LAST_POLLED_KEY: format_iso(end), BOOTSTRAP_DONE_KEY: "1"},
+        )
 
     return {
         "start": start.isoformat(),
         "end": end.isoformat(),
-        "fetched": len(logs),
+        "fetched": fetched,
         "inserted": inserted,
     }
 
@@ -90,8 +127,17 @@ async def poll_once():
 async def startup():
     logger.info("Application startup: initialising DB and scheduler")
 
-    conn = connect_db()
-    init_schema(conn)
+    # Schema (and any migrations) is ensured once here; poll_once and the
+    # routes only ever run after startup, so they don't repeat it.
+    app.state.rw_conn = connect_db()
+    init_schema(app.state.rw_conn)
+    app.state.write_lock = asyncio.Lock()
+
+    app.state.read_pool = asyncio.Queue()
+    for _ in range(settings.read_pool_size):
+        read_conn = connect_db()
+        read_conn.execute("PRAGMA query_only=1")
+        app.state.read_pool.put_nowait(read_conn)
 
     # Start scheduler immediately (UI becomes available)
     scheduler.add_job(
@@ -112,7 +158,22 @@ async def startup():
         except Exception:
             logger.exception("Initial background poll FAILED")
 
-    asyncio.create_task(initial_poll())
+    app.state.initial_poll = asyncio.create_task(initial_poll())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Stop anything that may still be polling before its HTTP client goes away
+    scheduler.shutdown(wait=False)
+    app.state.initial_poll.cancel()
+    await aclose_client()
+
+    # Close pooled connections so SQLite checkpoints and closes the WAL cleanly
+    pool: asyncio.Queue = app.state.read_pool
+    while not pool.empty():
+        pool.get_nowait().close()
+    async with app.state.write_lock:
+        app.state.rw_conn.close()
 
 
 # -------------------------------------------------------------------
@@ -120,16 +181,16 @@ async def startup():
 # -------------------------------------------------------------------
 
 @app.get("/", response_class=HTMLResponse)
-def index(request: Request, days: int | None = None):
+def index(request: Request, days: int | None = None, conn=Depends(get_read_conn)):
     days = days or settings.default_days
-    since = (utcnow() - dt.timedelta(days=days)).isoformat()
+    # The rollup is day-granular, so the window starts at midnight UTC of the first day
+    since = (utcnow() - dt.timedelta(days=days)).date().isoformat()
 
-    conn = connect_db()
     rows = conn.execute(
         """
-        SELECT email_addr, COUNT(*) AS cnt
-        FROM search_logs
-        WHERE create_time >= ?
+        SELECT email_addr, SUM(cnt) AS cnt
+        FROM search_logs_by_day
+        WHERE day >= ?
         GROUP BY email_addr
         ORDER BY cnt DESC
         """,
@@ -140,16 +201,14 @@ def index(request: Request, days: int | None = None):
         "index.html",
         {
             "request": request,
-            "rows": [{"email": r[0], "count": r[1]} for r in rows],
+            "rows": rows,
             "days": days,
         },
     )
 
 
 @app.post("/admin/reset-cursor")
-def reset_cursor():
-    conn = connect_db()
-    init_schema(conn)
+def reset_cursor(conn=Depends(get_write_conn)):
     conn.execute(
         "DELETE FROM kv WHERE k IN (?, ?)",
         [LAST_POLLED_KEY, BOOTSTRAP_DONE_KEY],
@@ -159,47 +218,57 @@ def reset_cursor():
 
 
 @app.get("/user/{email}", response_class=HTMLResponse)
-def user_detail(request: Request, email: str, days: int | None = None):
+def user_detail(
+    request: Request,
+    email: str,
+    days: int | None = None,
+    page: int = 1,
+    conn=Depends(get_read_conn),
+):
     days = days or settings.default_days
-    since = (utcnow() - dt.timedelta(days=days)).isoformat()
+    # Same day-aligned window as the summary page, so the totals agree; a bare
+    # YYYY-MM-DD compares <= every create_time on that day
+    since = (utcnow() - dt.timedelta(days=days)).date().isoformat()
+    page = max(page, 1)
 
-    conn = connect_db()
+    total = conn.execute(
+        "SELECT COUNT(*) FROM search_logs WHERE email_addr = ? AND create_time >= ?",
+        [email.lower(), since],
+    ).fetchone()[0]
+
+    # One extra row tells us whether there is a next page
     rows = conn.execute(
         """
         SELECT
             create_time,
-            email_addr,
-            source,
             search_text,
+            muse_query,
+            description,
             search_reason,
-            description
+            is_admin,
+            source,
+            search_path
         FROM search_logs
         WHERE email_addr = ?
           AND create_time >= ?
         ORDER BY create_time DESC
+        LIMIT ? OFFSET ?
         """,
-        [email.lower(), since],
+        [email.lower(), since, settings.page_size + 1, (page - 1) * settings.page_size],
     ).fetchall()
 
-    rows = [
-        {
-            "create_time": r[0],
-            "email_addr": r[1],
-            "source": r[2],
-            "search_text": r[3],
-            "search_reason": r[4],
-            "description": r[5],
-        }
-        for r in rows
-    ]
-
+    # Rows go to the template as plain tuples (unpacked in the for loop)
     return templates.TemplateResponse(
         "user.html",
         {
             "request": request,
             "email": email,
-            "rows": rows,
+            "rows": rows[:settings.page_size],
             "days": days,
+            "total": total,
+            "page": page,
+            "has_prev": page > 1,
+            "has_next": len(rows) > settings.page_size,
         },
     )
 
@@ -213,7 +282,11 @@ def calendar_view(request: Request):
 
 
 @app.get("/api/searches-per-day")
-def searches_per_day(year: int | None = None, month: int | None = None):
+def searches_per_day(
+    year: int | None = None,
+    month: int | None = None,
+    conn=Depends(get_read_conn),
+):
     now = utcnow()
     year = year or now.year
     month = month or now.month
@@ -224,17 +297,16 @@ def searches_per_day(year: int | None = None, month: int | None = None):
     else:
         end = dt.datetime(year, month + 1, 1, tzinfo=dt.timezone.utc)
 
-    conn = connect_db()
     rows = conn.execute(
         """
-        SELECT substr(create_time, 1, 10) AS day, COUNT(*)
+        SELECT day, COUNT(*)
         FROM search_logs
-        WHERE create_time >= ?
-          AND create_time < ?
+        WHERE day >= ?
+          AND day < ?
         GROUP BY day
         ORDER BY day
         """,
-        [start.isoformat(), end.isoformat()],
+        [start.date().isoformat(), end.date().isoformat()],
     ).fetchall()
 
     return {
@@ -245,46 +317,55 @@ def searches_per_day(year: int | None = None, month: int | None = None):
 
 
 @app.get("/api/searches-by-day")
-def searches_by_day(date: str):
-    conn = connect_db()
-
+def searches_by_day(date: str, conn=Depends(get_read_conn)):
     start = f"{date}T00:00:00"
     end = f"{date}T23:59:59"
 
-    rows = conn.execute(
+    # SQLite builds the whole JSON document: per-user counts come from the
+    # covering time index, and each user's entries are read newest-first
+    # straight off idx_search_logs_email_time, so nothing is regrouped or
+    # re-serialised in Python.
+    body = conn.execute(
         """
-        SELECT
-          email_addr,
-          create_time,
-          source,
-          search_text,
-          search_reason,
-          description
-        FROM search_logs
-        WHERE create_time >= ?
-          AND create_time <= ?
-        ORDER BY email_addr, create_time DESC
+        SELECT json_object(
+          'date', ?1,
+          'users', json((
+            SELECT json_group_array(json_object(
+              'email', u.email_addr,
+              'count', u.cnt,
+              'entries', json((
+                SELECT json_group_array(json_object(
+                  'create_time', create_time,
+                  'source', source,
+                  'search_text', search_text,
+                  'search_reason', search_reason,
+                  'description', description
+                ))
+                FROM (
+                  SELECT create_time, source, search_text, search_reason, description
+                  FROM search_logs
+                  WHERE email_addr = u.email_addr
+                    AND create_time >= ?2
+                    AND create_time <= ?3
+                  ORDER BY create_time DESC
+                )
+              ))
+            ))
+            FROM (
+              SELECT email_addr, COUNT(*) AS cnt
+              FROM search_logs
+              WHERE create_time >= ?2
+                AND create_time <= ?3
+              GROUP BY email_addr
+              ORDER BY email_addr
+            ) AS u
+          ))
+        )
         """,
-        [start, end],
-    ).fetchall()
-
-    grouped = {}
-    for r in rows:
-        grouped.setdefault(r[0], []).append({
-            "create_time": r[1],
-            "source": r[2],
-            "search_text": r[3],
-            "search_reason": r[4],
-            "description": r[5],
-        })
+        [date, start, end],
+    ).fetchone()[0]
 
-    return {
-        "date": date,
-        "users": [
-            {"email": email, "count": len(entries), "entries": entries}
-            for email, entries in grouped.items()
-        ],
-    }
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/day/{date}", response_class=HTMLResponse)
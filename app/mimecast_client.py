@@ -1,8 +1,11 @@
+import asyncio
 import datetime as dt
 import logging
-from typing import List, Dict, Any, Optional
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
+import orjson
 
 from .settings import settings
 
@@ -11,27 +14,78 @@ logger = logging.getLogger("mimecast")
 TOKEN_URL = "https://api.services.mimecast.com/oauth/token"
 ARCHIVE_SEARCH_URL = "https://api.services.mimecast.com/api/archive/get-archive-search-logs"
 
+# One pooled client for the process: keeps TLS/HTTP2 connections to the
+# Mimecast API alive across token requests, pages and polls.
+_client = httpx.AsyncClient(
+    http2=True,
+    timeout=60,
+    limits=httpx.Limits(max_keepalive_connections=32),
+)
+
+
+async def aclose_client() -> None:
+    await _client.aclose()
+
+
+def format_iso(ts: dt.datetime) -> str:
+    # UTC timestamp with a "Z" suffix, as sent to Mimecast and stored as the
+    # poll cursor; formatted in one pass instead of isoformat() + replace()
+    return f"{ts.astimezone(dt.timezone.utc):%Y-%m-%dT%H:%M:%S.%f}Z"
+
 
 # -------------------------------------------------
 # OAuth
 # -------------------------------------------------
 
+# (access_token, monotonic expiry) reused until shortly before it expires
+_token: Optional[Tuple[str, float]] = None
+TOKEN_EXPIRY_MARGIN_SECONDS = 60
+
+
 async def get_access_token() -> str:
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.post(
-            TOKEN_URL,
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            data={
-                "client_id": settings.mimecast_client_id,
-                "client_secret": settings.mimecast_client_secret,
-                "grant_type": "client_credentials",
-            },
-        )
-        resp.raise_for_status()
-        token = resp.json().get("access_token")
-        if not token:
-            raise RuntimeError("No access_token returned from Mimecast")
-        return token
+    global _token
+    if _token and time.monotonic() < _token[1] - TOKEN_EXPIRY_MARGIN_SECONDS:
+        return _token[0]
+
+    resp = await _client.post(
+        TOKEN_URL,
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+        data={
+            "client_id": settings.mimecast_client_id,
+            "client_secret": settings.mimecast_client_secret,
+            "grant_type": "client_credentials",
+        },
+        timeout=30,
+    )
+    resp.raise_for_status()
+    body = resp.json()
+    token = body.get("access_token")
+    if not token:
+        raise RuntimeError("No access_token returned from Mimecast")
+
+    # Without expires_in, don't cache at all rather than guess a lifetime
+    expires_in = body.get("expires_in")
+    _token = (token, time.monotonic() + float(expires_in)) if expires_in else None
+    return token
+
+
+# Largest pageSize the API has accepted this process; starts at the configured
+# value and is halved whenever Mimecast rejects it as too large.
+_page_size: Optional[int] = None
+MIN_PAGE_SIZE = 25
+
+
+def _is_page_size_error(resp: httpx.Response) -> bool:
+    # Only decode the body of a 400; successful pages are parsed from raw bytes
+    if resp.status_code != 400:
+        return False
+    text = resp.text.lower()
+    return "pagesize" in text or "page size" in text
+
+
+def invalidate_access_token() -> None:
+    global _token
+    _token = None
 
 
 # -------------------------------------------------
@@ -41,61 +95,89 @@ async def get_access_token() -> str:
 async def fetch_search_logs(
     start: dt.datetime,
     end: dt.datetime,
-) -> List[Dict[str, Any]]:
+) -> AsyncIterator[List[Dict[str, Any]]]:
     """
-    Fetch ALL archive search logs between start and end.
+    Fetch ALL archive search logs between start and end, yielding one page
+    of logs at a time so callers never hold the whole range in memory.
     Handles API 2.0 pagination correctly using pageToken.
-    """
 
-    token = await get_access_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
+    The next page is already in flight while the caller handles the current
+    one, so persisting a page does not stall pagination.
+    """
 
-    start_iso = start.isoformat().replace("+00:00", "Z")
-    end_iso = end.isoformat().replace("+00:00", "Z")
+    start_iso = format_iso(start)
+    end_iso = format_iso(end)
 
-    page_token: Optional[str] = None
-    all_logs: List[Dict[str, Any]] = []
+    fetched = 0
     page = 0
     total_count: Optional[int] = None
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        while True:
-            payload: Dict[str, Any] = {
-                "meta": {
-                    "pagination": {
-                        "pageSize": settings.archive_page_size,
-                    }
-                },
-                "data": [
-                    {
-                        "from": start_iso,
-                        "to": end_iso,
-                    }
-                ],
-            }
-
-            if page_token:
-                payload["meta"]["pagination"]["pageToken"] = page_token
-
-            logger.info(
-                "Mimecast request: %s → %s (pageToken=%s)",
-                start_iso,
-                end_iso,
-                "set" if page_token else "none",
-            )
-
-            resp = await client.post(
+    async def post(payload: Dict[str, Any]) -> httpx.Response:
+        # Token is looked up per request (cached, so cheap): a long backfill can
+        # outlive the token that was current when it started.
+        for attempt in range(2):
+            token = await get_access_token()
+            resp = await _client.post(
                 ARCHIVE_SEARCH_URL,
-                headers=headers,
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": "application/json",
+                    "Accept": "application/json",
+                },
                 json=payload,
             )
-            resp.raise_for_status()
+            if resp.status_code != 401 or attempt:
+                return resp
+            # Token revoked/expired early: mint a fresh one and retry once
+            logger.warning("Mimecast returned 401; refreshing access token")
+            invalidate_access_token()
+        return resp
+
+    async def request_page(page_token: Optional[str]) -> Dict[str, Any]:
+        global _page_size
+        page_size = _page_size or settings.archive_page_size
+
+        payload: Dict[str, Any] = {
+            "meta": {
+                "pagination": {
+                    "pageSize": page_size,
+                }
+            },
+            "data": [
+                {
+                    "from": start_iso,
+                    "to": end_iso,
+                }
+            ],
+        }
+
+        if page_token:
+            payload["meta"]["pagination"]["pageToken"] = page_token
+
+        logger.info(
+            "Mimecast request: %s → %s (pageToken=%s)",
+            start_iso,
+            end_iso,
+            "set" if page_token else "none",
+        )
+
+        resp = await post(payload)
+        while _is_page_size_error(resp) and page_size > MIN_PAGE_SIZE:
+            page_size = max(page_size // 2, MIN_PAGE_SIZE)
+            logger.warning("Mimecast rejected pageSize; retrying with %d", page_size)
+            payload["meta"]["pagination"]["pageSize"] = page_size
+            resp = await post(payload)
+        if resp.is_success:
+            _page_size = page_size
+        resp.raise_for_status()
+
+        return orjson.loads(resp.content)
 
-            body = resp.json()
+    pending: Optional[asyncio.Task] = asyncio.create_task(request_page(None))
+    try:
+        while pending:
+            body = await pending
+            pending = None
 
             page += 1
 
@@ -105,22 +187,27 @@ async def fetch_search_logs(
             if total_count is None:
                 total_count = pagination.get("totalCount")
 
+            # Only cursor pagination is available, so overlap the next
+            # round-trip with whatever the caller does with this page
+            if page_token:
+                pending = asyncio.create_task(request_page(page_token))
+
             data = body.get("data") or []
             logs = []
             if data and isinstance(data, list):
                 logs = data[0].get("logs") or []
 
-            all_logs.extend(logs)
+            fetched += len(logs)
 
             logger.info(
                 "Fetched page %d: %d logs (total so far: %d%s)",
                 page,
                 len(logs),
-                len(all_logs),
+                fetched,
                 f" / {total_count}" if total_count else "",
             )
 
-            if not page_token:
-                break
-
-    return all_logs
+            yield logs
+    finally:
+        if pending:
+            pending.cancel()
@@ -48,8 +48,11 @@ class Settings(BaseSettings):
     # Mimecast API pagination (IMPORTANT)
     # -------------------------------------------------
     archive_page_size: int = Field(
-        default=100,
-        description="Page size for Mimecast archive search logs API (API 2.0 pagination)",
+        default=500,
+        description=(
+            "Page size for Mimecast archive search logs API (API 2.0 pagination); "
+            "halved automatically if the API rejects it"
+        ),
     )
 
     # -------------------------------------------------
@@ -71,6 +74,11 @@ class Settings(BaseSettings):
         description="Optional libSQL/Turso auth token",
     )
 
+    read_pool_size: int = Field(
+        default=4,
+        description="Number of pooled read-only DB connections for UI/API requests",
+    )
+
     # -------------------------------------------------
     # UI defaults
     # -------------------------------------------------